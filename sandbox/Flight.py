@@ -52,13 +52,13 @@ def vessel_pitch(vessel):
 # <codecell>
 
 cont_alt = wernher.Controller(set_point=5000,kp=1/3,t0=ksc.ut)
-cont_alt.min = -15
-cont_alt.max =  15
+cont_alt.cmin = -15
+cont_alt.cmax =  15
 cont_alt.ziegler_nichols(ku=1/3,tu=6,control_type='no_overshoot')
 
 cont_pitch = wernher.Controller(set_point=5,kp=1/30,t0=ksc.ut)
-cont_pitch.min = -1
-cont_pitch.max =  1
+cont_pitch.cmin = -1
+cont_pitch.cmax =  1
 cont_pitch.ziegler_nichols(ku=1/25,tu=1,control_type='no_overshoot')
 
 while True:
@@ -74,12 +74,12 @@ while True:
 
 con_alt = wernher.Controller(set_point=5000)
 con_alt.ziegler_nichols(ku=1/2000,tu=33)
-con_alt.min = -1
-con_alt.max =  1
+con_alt.cmin = -1
+con_alt.cmax =  1
 
 #con_pitch = wernher.Controller(set_point=0,kp=15)
-#con_pitch.min = -1
-#con_pitch.max =  1
+#con_pitch.cmin = -1
+#con_pitch.cmax =  1
 
 while True:
     t = ksc.ut
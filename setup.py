@@ -42,6 +42,7 @@ setup(
                     'numpy>=1.8.0',
                     'scipy>=0.14.1',
                     'matplotlib>=1.3.1',
+                    'Pillow',
                     ],
     cmdclass={'test': PyTest},
     author_email='theodore.goetz@gmail.com',
@@ -0,0 +1,344 @@
+import io
+import os
+import pickle
+
+import numpy as np
+import matplotlib.collections as mcoll
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from wernher import MapView
+from wernher import map_view
+
+
+class Body:
+    name = 'Body'
+
+
+def split(lat,lon,*args):
+    '''split_tracks output as a list of [lat, lon, *z] per track'''
+    tracks = MapView.split_tracks(lat,lon,*args)
+    return [list(t) for t in zip(np.split(tracks.lat,tracks.breaks),
+                                 np.split(tracks.lon,tracks.breaks),
+                                 *[np.split(z,tracks.breaks)
+                                   for z in tracks.zs])]
+
+
+class TestSplitTracks:
+
+    def check(self,tracks,expected):
+        assert len(tracks) == len(expected)
+        for track,exp in zip(tracks,expected):
+            assert len(track) == len(exp)
+            for a,b in zip(track,exp):
+                assert np.array_equal(a,b), '{} != {}'.format(a,b)
+
+    def test_no_wrap(self):
+        lat = [0,1,2]
+        lon = [10,20,30]
+        self.check(split(lat,lon), [[lat,lon]])
+
+    def test_eastward_wrap(self):
+        lat = [0,1,2,3]
+        lon = [170,175,-175,-170]
+        z = [10,11,12,13]
+        self.check(split(lat,lon,z), [
+            [[0,1,2], [170,175,185], [10,11,12]],
+            [[1,2,3], [-185,-175,-170], [11,12,13]]])
+
+    def test_westward_wrap(self):
+        lat = [0,1,2,3]
+        lon = [-170,-175,175,170]
+        z = [10,11,12,13]
+        self.check(split(lat,lon,z), [
+            [[0,1,2], [-170,-175,-185], [10,11,12]],
+            [[1,2,3], [185,175,170], [11,12,13]]])
+
+    def test_back_to_back_wraps(self):
+        lat = [0,1,2]
+        lon = [170,-170,170]
+        z = [10,11,12]
+        self.check(split(lat,lon,z), [
+            [[0,1], [170,190], [10,11]],
+            [[0,1,2], [-190,-170,-190], [10,11,12]],
+            [[1,2], [190,170], [11,12]]])
+
+    def test_z_matches_track_length(self):
+        lon = np.r_[np.linspace(0,170,10), np.linspace(-170,0,10)][::-1]
+        lat = np.linspace(-10,10,len(lon))
+        for lt,ln,z in split(lat,lon,np.arange(len(lon))):
+            assert len(lt) == len(ln) == len(z)
+
+
+def make_tiles(root,zoomlevel=1,size=4):
+    '''write uniform tiles filled with 16*col+row, returning their path'''
+    fpath = os.path.join(str(root),'body','sat',str(zoomlevel))
+    os.makedirs(fpath)
+    for col in range(2**(zoomlevel+1)):
+        for row in range(2**zoomlevel):
+            data = np.full((size,size,4),16*col+row,dtype=np.uint8)
+            Image.fromarray(data).save(
+                os.path.join(fpath,'{}_{}.png'.format(col,row)))
+    return fpath
+
+
+class TestSplitTracksFlat:
+
+    def check(self,tracks,lat,lon,zs,breaks):
+        assert isinstance(tracks,map_view.SplitTracks)
+        assert np.array_equal(tracks.lat,lat)
+        assert np.array_equal(tracks.lon,lon)
+        assert len(tracks.zs) == len(zs)
+        for a,b in zip(tracks.zs,zs):
+            assert np.array_equal(a,b)
+        assert np.array_equal(tracks.breaks,breaks)
+
+    def test_eastward_wrap(self):
+        self.check(MapView.split_tracks([0,1,2,3],[170,175,-175,-170]),
+            [0,1,2,1,2,3], [170,175,185,-185,-175,-170], [], [3])
+
+    def test_westward_wrap(self):
+        self.check(MapView.split_tracks([0,1,2,3],[-170,-175,175,170]),
+            [0,1,2,1,2,3], [-170,-175,-185,185,175,170], [], [3])
+
+    def test_back_to_back_wraps(self):
+        self.check(MapView.split_tracks([0,1,2],[170,-170,170],[10,11,12]),
+            [0,1,0,1,2,1,2], [170,190,-190,-170,-190,190,170],
+            [[10,11,10,11,12,11,12]], [2,5])
+
+    def test_single_sample(self):
+        self.check(MapView.split_tracks([5],[10],[1]),
+            [5], [10], [[1]], [])
+
+    def test_empty(self):
+        self.check(MapView.split_tracks([],[]), [], [], [], [])
+
+
+class TestTickFormat:
+
+    def test_longitude(self):
+        assert map_view._lon_fmt(0,None) == '0˚'
+        assert map_view._lon_fmt(45,None) == '45˚ E'
+        assert map_view._lon_fmt(-45,None) == '45˚ W'
+        assert map_view._lon_fmt(180,None) == '180˚'
+        assert map_view._lon_fmt(-180,None) == '180˚'
+        assert map_view._lon_fmt(np.float64(-90),None) == '90˚ W'
+
+    def test_latitude(self):
+        assert map_view._lat_fmt(0,None) == '0˚'
+        assert map_view._lat_fmt(45,None) == '45˚ N'
+        assert map_view._lat_fmt(-45,None) == '45˚ S'
+        assert map_view._lat_fmt(np.float64(90),None) == '90˚ N'
+        assert map_view._lat_fmt(np.float64(-90),None) == '90˚ S'
+
+
+class TestPlotTrack:
+
+    lat = [0,1,2,3]
+    lon = [170,175,-175,-170]
+
+    def axes(self):
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        return fig.add_subplot(1,1,1)
+
+    def test_single_collection(self):
+        pts = MapView.plot_track(self.axes(),self.lat,self.lon)
+        assert len(pts) == 1
+        assert isinstance(pts[0],mcoll.LineCollection)
+        segs = pts[0].get_segments()
+        assert len(segs) == 2
+        assert np.array_equal(segs[0],[[170,0],[175,1],[185,2]])
+
+    def test_line2d_options(self):
+        pts = MapView.plot_track(self.axes(),self.lat,self.lon,marker='o')
+        assert len(pts) == 1
+        assert pts[0].get_marker() == 'o'
+        assert np.array_equal(pts[0].get_xdata(),
+            [170,175,185,np.nan,-185,-175,-170],equal_nan=True)
+
+    def test_colored(self):
+        z = np.array([0.,1,2,3])
+        pts = MapView.plot_track(self.axes(),self.lat,self.lon,z)
+        assert len(pts) == 1
+        assert np.isnan(np.ma.getdata(pts[0].get_array())[3])
+
+
+class TestMosaicCache:
+
+    def build(self,monkeypatch,root):
+        monkeypatch.setattr(map_view,'_MAP_ROOT',str(root))
+        return map_view._build_mosaic('body','sat',1)
+
+    def test_cache_is_written_and_reused(self,monkeypatch,tmp_path):
+        fpath = make_tiles(tmp_path)
+        built = np.array(self.build(monkeypatch,tmp_path))
+        assert os.listdir(fpath).count('_mosaic.npy') == 1
+        assert not [f for f in os.listdir(fpath)
+                    if f.endswith('.npy') and f != '_mosaic.npy']
+        cached = self.build(monkeypatch,tmp_path)
+        assert isinstance(cached,np.memmap)
+        assert np.array_equal(cached,built)
+
+    def test_truncated_cache_is_rebuilt(self,monkeypatch,tmp_path):
+        fpath = make_tiles(tmp_path)
+        built = np.array(self.build(monkeypatch,tmp_path))
+        cache_path = os.path.join(fpath,'_mosaic.npy')
+        with open(cache_path,'r+b') as fout:
+            fout.truncate(64)
+        assert np.array_equal(self.build(monkeypatch,tmp_path),built)
+        assert isinstance(self.build(monkeypatch,tmp_path),np.memmap)
+
+    def test_memory_cache_is_bounded(self,monkeypatch,tmp_path):
+        for zoomlevel in (1,2,3):
+            make_tiles(tmp_path,zoomlevel)
+        monkeypatch.setattr(map_view,'_MAP_ROOT',str(tmp_path))
+        monkeypatch.setattr(map_view,'_MAX_MOSAICS',2)
+        map_view._mosaics.clear()
+        get = lambda z,**kw: map_view._get_mosaic('body','sat',z,**kw)
+        mosaic = get(1)
+        assert get(1,build=False,check_disk=False) is mosaic
+        get(2)
+        get(1)
+        get(3)
+        assert list(map_view._mosaics) == [('body','sat',1),('body','sat',3)]
+        assert get(2,build=False,check_disk=False) is None
+        assert isinstance(get(2,build=False),np.memmap)
+        map_view._mosaics.clear()
+
+
+class TestTileWindow:
+
+    # zoomlevel 2: 8 columns by 4 rows of 45 degree tiles
+    mview = MapView(Body(),zoomlevel=2)
+
+    def test_full_view(self):
+        assert self.mview._tile_window((-180,180),(-90,90)) == (0,8,0,4)
+
+    def test_partial_view(self):
+        assert self.mview._tile_window((-100,10),(-10,50)) == (1,5,1,4)
+
+    def test_tile_edges(self):
+        assert self.mview._tile_window((-135,-90),(0,45)) == (1,2,2,3)
+
+    def test_inverted_limits(self):
+        assert self.mview._tile_window((180,-180),(90,-90)) == (0,8,0,4)
+        assert self.mview._tile_window((10,-100),(50,-10)) == (1,5,1,4)
+
+    def test_limits_outside_map(self):
+        assert self.mview._tile_window((-400,400),(-200,200)) == (0,8,0,4)
+        assert self.mview._tile_window((200,300),(100,120)) == (7,8,3,4)
+        assert self.mview._tile_window((-300,-200),(-120,-100)) == (0,1,0,1)
+
+
+class TestBasemap:
+
+    def make_basemap(self,monkeypatch,tmp_path,xlim=None,ylim=None):
+        make_tiles(tmp_path,zoomlevel=2)
+        monkeypatch.setattr(map_view,'_MAP_ROOT',str(tmp_path))
+        monkeypatch.setattr(MapView,'set_ticks',staticmethod(lambda ax: None))
+        map_view._mosaics.clear()
+
+        decoded = []
+        get_tile = MapView.get_tile
+        def _get_tile(self,col,row):
+            decoded.append((col,row))
+            return get_tile(self,col,row)
+        monkeypatch.setattr(MapView,'get_tile',_get_tile)
+
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1,1,1)
+        if xlim is not None:
+            ax.set_xlim(*xlim)
+            ax.set_ylim(*ylim)
+        im = MapView(Body(),zoomlevel=2).plot_basemap(ax)
+        return fig,ax,im,decoded
+
+    def expected(self,c0,c1,r0,r1):
+        cols,rows = np.arange(c0,c1),np.arange(r0,r1)
+        return np.repeat(np.repeat(16*cols[None,:]+rows[:,None],4,0),4,1)
+
+    def test_filled_on_creation(self,monkeypatch,tmp_path):
+        fig,ax,im,decoded = self.make_basemap(monkeypatch,tmp_path)
+        assert np.array_equal(im.get_array()[...,0],self.expected(0,8,0,4))
+        assert list(im.get_extent()) == [-180,180,-90,90]
+        assert (ax.get_xlim(),ax.get_ylim()) == ((-180,180),(-90,90))
+
+    def test_only_view_is_decoded(self,monkeypatch,tmp_path):
+        fig,ax,im,decoded = self.make_basemap(monkeypatch,tmp_path,
+                                              (-100,10),(-10,50))
+        assert sorted(decoded) == [(c,r) for c in range(1,5)
+                                         for r in range(1,4)]
+        assert np.array_equal(im.get_array()[...,0],self.expected(1,5,1,4))
+        assert list(im.get_extent()) == [-135,45,-45,90]
+        fig.canvas.draw()
+        assert len(decoded) == 12
+
+    def test_pan_decodes_only_new_tiles(self,monkeypatch,tmp_path):
+        fig,ax,im,decoded = self.make_basemap(monkeypatch,tmp_path,
+                                              (-100,10),(-10,50))
+        del decoded[:]
+        ax.set_xlim(-55,55)
+        fig.canvas.draw()
+        assert sorted(decoded) == [(5,r) for r in range(1,4)]
+        assert np.array_equal(im.get_array()[...,0],self.expected(2,6,1,4))
+        fig.canvas.draw()
+        assert len(decoded) == 3
+
+    def test_mosaic_in_memory_is_sliced(self,monkeypatch,tmp_path):
+        # e.g. a read-only install where the disk cache cannot be saved
+        monkeypatch.setattr(map_view,'_save_mosaic',lambda *args: None)
+        fig,ax,im,decoded = self.make_basemap(monkeypatch,tmp_path)
+        ax.set_xlim(-100,10)
+        ax.set_ylim(-10,50)
+        fig.canvas.draw()
+        assert decoded == []
+        assert np.array_equal(im.get_array()[...,0],self.expected(1,5,1,4))
+
+    def test_disk_cache_checked_once(self,monkeypatch,tmp_path):
+        fig,ax,im,decoded = self.make_basemap(monkeypatch,tmp_path)
+        map_view._mosaics.clear()
+
+        checks = []
+        mosaic_cache = map_view._mosaic_cache
+        def _mosaic_cache(*args):
+            checks.append(args)
+            return mosaic_cache(*args)
+        monkeypatch.setattr(map_view,'_mosaic_cache',_mosaic_cache)
+
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(1,1,1)
+        im = MapView(Body(),zoomlevel=2).plot_basemap(ax)
+        ax.set_ylim(-10,50)
+        for x0 in (-100,-55,-10):
+            ax.set_xlim(x0,x0+110)
+            fig.canvas.draw()
+        assert len(checks) == 2  # the check on creation and the load
+        assert decoded == []
+        assert np.array_equal(im.get_array()[...,0],self.expected(3,7,1,4))
+
+    def test_refreshed_when_composited(self,monkeypatch,tmp_path):
+        fig,ax,im,decoded = self.make_basemap(monkeypatch,tmp_path)
+        ax.imshow(np.zeros((2,2)),extent=[-10,10,-10,10])
+        ax.set_xlim(-100,10)
+        ax.set_ylim(-10,50)
+        fig.savefig(io.BytesIO(),format='svg')
+        assert np.array_equal(im.get_array()[...,0],self.expected(1,5,1,4))
+        assert list(im.get_extent()) == [-135,45,-45,90]
+
+    def test_pickle(self,monkeypatch,tmp_path):
+        fig,ax,im,decoded = self.make_basemap(monkeypatch,tmp_path)
+        ax.set_xlim(-100,10)
+        ax.set_ylim(-10,50)
+        fig.canvas.draw()
+        fig = pickle.loads(pickle.dumps(fig))
+        FigureCanvasAgg(fig)
+        ax = fig.axes[0]
+        im, = ax.images
+        assert np.array_equal(im.get_array()[...,0],self.expected(1,5,1,4))
+        ax.set_xlim(-55,55)
+        fig.canvas.draw()
+        assert np.array_equal(im.get_array()[...,0],self.expected(2,6,1,4))
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from wernher import Controller
+
+
+class TestController:
+
+    def test_proportional_only_default(self):
+        c = Controller()
+        assert c.ti == np.inf
+        assert c.td == 0
+        assert c(0.5,1) == -0.5
+        assert c.kiI == 0
+
+    def test_zero_gains(self):
+        assert Controller(kp=0,kd=1).td == np.inf
+        assert Controller(kp=0,ki=0,kd=0)(0.5,1) == 0
+
+    def test_no_time_passed(self):
+        c = Controller()
+        assert c(0.5,1) == -0.5
+        assert c(0.2,1) == -0.5
+
+    def test_deadband(self):
+        c = Controller(deadband=0.1)
+        assert c(0.05,1) == 0
+        assert c(0.2,2) == -0.2
+
+    def test_clipping(self):
+        assert Controller(kp=10)(1,1) == -1
+        assert Controller(kp=10)(-1,1) == 1
+        assert Controller(kp=10,cmin=-2,cmax=3)(-5,1) == 3
+        assert Controller(kp=10,cmin=-2,cmax=3)(5,1) == -2
+
+    def test_integral_clipped(self):
+        c = Controller(kp=0.5,ki=2.5)
+        for i in range(1,21):
+            c(-0.5,0.1*i)
+        assert c.kiI == 1
+        assert c.c == 1
+
+    def test_integral_reset_when_saturated(self):
+        c = Controller(kp=1,ki=1)
+        assert c(-0.5,0.5) == 0.75
+        assert c.kiI == 0.25
+        assert c(-5,1) == 1
+        assert c.kiI == 0
+
+    def test_negative_integral_gain(self):
+        c = Controller(kp=1,ki=-1)
+        assert c(0.5,1) == -0.5
+        assert c.kiI == 0
+
+    def test_step_batch(self):
+        ts = np.linspace(0.1,5,50)
+        xs = np.sin(ts)
+        batch = Controller(kp=1,ki=0.5,kd=0.1)
+        single = Controller(kp=1,ki=0.5,kd=0.1)
+        out = batch.step_batch(iter(xs.tolist()),ts)
+        assert np.array_equal(out,[single(x,t) for x,t in zip(xs,ts)])
+        for attr in ('t0','kiI','P0','c'):
+            assert getattr(batch,attr) == getattr(single,attr)
+
+    def test_step_batch_length_mismatch(self):
+        with pytest.raises(ValueError):
+            Controller().step_batch([0,1,2],[1,2])
+        with pytest.raises(ValueError):
+            Controller().step_batch([0,1],[1,2,3])
+
+    def test_ziegler_nichols(self):
+        ku,tu = 3.,.7
+        expected = dict(
+            p = (.5*ku, 0, 0),
+            pi = (.45*ku, 1.2*(.45*ku)/tu, 0),
+            pd = (.8*ku, 0, (.8*ku)*tu/8),
+            pid = (.6*ku, 2*(.6*ku)/tu, (.6*ku)*tu/8),
+            pessen = (.7*ku, 2.5*(.7*ku)/tu, 3*(.7*ku)*tu/20),
+            some_overshoot = (.33*ku, 2*(.33*ku)/tu, (.33*ku)*tu/3),
+            no_overshoot = (.2*ku, 2*(.2*ku)/tu, (.2*ku)*tu/3),
+        )
+        for control_type,gains in expected.items():
+            ctrl = Controller()
+            ctrl.ziegler_nichols(ku,tu,control_type.upper())
+            assert (ctrl.kp,ctrl.ki,ctrl.kd) == pytest.approx(gains), \
+                control_type
@@ -35,8 +35,16 @@ def make_segments(x, y):
     and y) array
     """
 
-    points = np.array([x, y]).T.reshape(-1, 1, 2)
-    segments = np.concatenate([points[:-1], points[1:]], axis=1)
+    x = np.asarray(x)
+    y = np.asarray(y)
+
+    # fill the segment array in place rather than stacking and
+    # concatenating intermediate point arrays
+    segments = np.empty((max(len(x) - 1, 0), 2, 2))
+    segments[:, 0, 0] = x[:-1]
+    segments[:, 0, 1] = y[:-1]
+    segments[:, 1, 0] = x[1:]
+    segments[:, 1, 1] = y[1:]
     return segments
 
 
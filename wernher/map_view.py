@@ -1,9 +1,33 @@
 import os
+import tempfile
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from matplotlib import pyplot, ticker, cm, colors
+import matplotlib.collections as mcoll
+import matplotlib.image as mimage
+from PIL import Image
 
 from .colorline import colorline
 
+_MAP_ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                         '..','map_images')
+
+SplitTracks = namedtuple('SplitTracks','lat lon zs breaks')
+
+# stitched mosaics held in memory, least recently used first, keyed
+# by (bodyname,maptype,zoomlevel). see _get_mosaic
+_mosaics = OrderedDict()
+_MAX_MOSAICS = 4
+
+# Line2D options a LineCollection does not take, see MapView.plot_track
+_LINE2D_ONLY = frozenset([
+    'marker','markersize','ms','markevery','fillstyle',
+    'markerfacecolor','mfc','markerfacecoloralt','mfcalt',
+    'markeredgecolor','mec','markeredgewidth','mew',
+    'drawstyle','ds','dash_capstyle','dash_joinstyle',
+    'solid_capstyle','solid_joinstyle'])
+
 ''' example using basemap:
 
 from mpl_toolkits.basemap import Basemap
@@ -18,6 +42,175 @@ bmap.drawparallels(major_parallels, **line_opts)
 bmap.drawmeridians(major_meridians, **line_opts)
 '''
 
+def _read_tile(fname):
+    '''decode a png map tile directly to a uint8 RGBA array'''
+    with Image.open(fname) as im:
+        if im.mode != 'RGBA':
+            im = im.convert('RGBA')
+        return np.asarray(im)
+
+_LON_DIRS = (' W','',' E')
+_LAT_DIRS = (' S','',' N')
+
+def _lon_fmt(x,pos):
+    x = float(x)
+    i = (x > 1e-9) - (x < -1e-9) + 1
+    if abs(abs(x)-180) < 1e-9:
+        i = 1
+    return f'{abs(x):g}˚{_LON_DIRS[i]}'
+
+def _lat_fmt(x,pos):
+    x = float(x)
+    return f'{abs(x):g}˚{_LAT_DIRS[(x > 1e-9) - (x < -1e-9) + 1]}'
+
+def _mosaic_cache(bodyname,maptype,zoomlevel):
+    '''
+        path to the decoded mosaic cached next to the tiles and whether
+        it is still valid, i.e. the tile directory has not changed
+        since it was written
+    '''
+    fpath = os.path.join(_MAP_ROOT,bodyname,maptype,str(zoomlevel))
+    cache_path = os.path.join(fpath,'_mosaic.npy')
+    valid = os.path.exists(cache_path) and \
+        os.path.getmtime(cache_path) >= os.path.getmtime(fpath)
+    return cache_path,valid
+
+def _save_mosaic(cache_path,mosaic):
+    '''
+        write the mosaic cache through a temporary file so that a reader
+        never sees a partially written cache, failures are ignored
+    '''
+    try:
+        fd,tmp_path = tempfile.mkstemp(suffix='.npy',
+                                       dir=os.path.dirname(cache_path))
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd,'wb') as fout:
+            np.save(fout,mosaic)
+        os.replace(tmp_path,cache_path)
+        # the rename updates the mtime of the tile directory, so the
+        # cache is touched to keep it from being considered stale
+        os.utime(cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def _build_mosaic(bodyname,maptype,zoomlevel):
+    '''stitch the map tiles of a body into a single uint8 image'''
+    fpath = os.path.join(_MAP_ROOT,bodyname,maptype,str(zoomlevel))
+    ffmt = '{col}_{row}.png'
+
+    # memory-mapped so that only the parts of the map actually drawn
+    # are paged in from disk
+    cache_path,valid = _mosaic_cache(bodyname,maptype,zoomlevel)
+    if valid:
+        try:
+            return np.load(cache_path,mmap_mode='r')
+        except (OSError,ValueError,EOFError):
+            # unreadable cache, rebuild it from the tiles
+            pass
+
+    ncols = 2**(zoomlevel+1)
+    nrows = 2**zoomlevel
+    tiles = [(col,row,os.path.join(fpath,ffmt.format(col=col,row=row)))
+             for col in range(ncols) for row in range(nrows)]
+
+    # all tiles share the same shape, so the mosaic can be
+    # allocated once from the first tile and each tile written
+    # directly into place
+    data = _read_tile(tiles[0][2])
+    th,tw = data.shape[:2]
+    mosaic = np.empty((nrows*th,ncols*tw) + data.shape[2:],
+                      dtype=np.uint8)
+
+    def _place(col,row,data):
+        mosaic[row*th:(row+1)*th,col*tw:(col+1)*tw] = data[::-1]
+
+    def _decode(tile):
+        col,row,fname = tile
+        _place(col,row,_read_tile(fname))
+
+    _place(0,0,data)
+    del data
+
+    # png decoding releases the GIL and each tile writes to a
+    # disjoint slice of the mosaic, so the tiles are decoded in
+    # parallel
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(_decode,tiles[1:]))
+
+    _save_mosaic(cache_path,mosaic)
+
+    # the mosaic is shared by every MapView through _mosaics
+    mosaic.setflags(write=False)
+    return mosaic
+
+def _get_mosaic(bodyname,maptype,zoomlevel,build=True,check_disk=True):
+    '''
+        the full map image held in memory, else loaded from the disk
+        cache or stitched from the tiles. without build the tiles are
+        never decoded, without check_disk the disk cache is not looked
+        at either, None being returned instead
+    '''
+    key = (bodyname,maptype,zoomlevel)
+    mosaic = _mosaics.pop(key,None)
+    if mosaic is None:
+        if not (build or check_disk and _mosaic_cache(*key)[1]):
+            return None
+        mosaic = _build_mosaic(*key)
+    _mosaics[key] = mosaic
+    while len(_mosaics) > _MAX_MOSAICS:
+        _mosaics.popitem(last=False)
+    return mosaic
+
+class _BasemapImage(mimage.AxesImage):
+    '''
+        map image of a MapView showing only the tiles within the axes
+        view. the view is restitched whenever the image is rendered, so
+        setting the x and y limits in turn only stitches the final view
+    '''
+    def __init__(self,ax,mview,**kwargs):
+        super().__init__(ax,**kwargs)
+        self.mview = mview
+        self._window = None
+        self._mosaic = None
+        # the disk cache of the full map is checked only once
+        self._check_disk = True
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # the full map is looked up again rather than pickled along
+        state['_mosaic'] = None
+        return state
+
+    def refresh(self):
+        '''stitch the tiles in view if they changed since the last call'''
+        ax,mview = self.axes,self.mview
+        window = mview._tile_window(ax.get_xlim(),ax.get_ylim())
+        if window == self._window:
+            return
+        if self._mosaic is None:
+            self._mosaic = mview._cached_image(self._check_disk)
+            self._check_disk = False
+        ncols,nrows = mview._grid[:2]
+        if self._mosaic is None and window == (0,ncols,0,nrows):
+            self._mosaic = mview.image
+        previous = None
+        if self._window is not None:
+            previous = (self._window,np.ma.getdata(self.get_array()))
+        data,extent = mview._tile_image(*window,previous=previous,
+                                        mosaic=self._mosaic)
+        self._window = window
+        self.set_data(data)
+        self.set_extent(extent)
+
+    def make_image(self,renderer,magnification=1.0,unsampled=False):
+        self.refresh()
+        return super().make_image(renderer,magnification,unsampled)
+
 class MapView(object):
     def __init__(self,body,**kwargs):
         self.body = body
@@ -29,73 +222,124 @@ class MapView(object):
         opts = dict(nbins=9, steps=[1, 2, 3, 6, 15, 18])
         ax.xaxis.set_major_locator(ticker.MaxNLocator(**opts))
         ax.yaxis.set_major_locator(ticker.MaxNLocator(**opts))
-        def _lon_fmt(x,pos):
-            def _lon_dir(x):
-                if np.isclose(x,0) or np.isclose(abs(x),180):
-                    return ''
-                elif x < 0:
-                    return ' W'
-                else:
-                    return ' E'
-            s = '{x:g}˚{dir}'.format(x=abs(x),dir=_lon_dir(x))
-            return s
-        def _lat_fmt(x,pos):
-            def _lat_dir(x):
-                if np.isclose(x,0):
-                    return ''
-                elif x < 0:
-                    return ' S'
-                else:
-                    return ' N'
-            s ='{x:g}˚{dir}'.format(x=abs(x),dir=_lat_dir(x))
-            return s
         ax.xaxis.set_major_formatter(ticker.FuncFormatter(_lon_fmt))
         ax.yaxis.set_major_formatter(ticker.FuncFormatter(_lat_fmt))
 
     @staticmethod
     def split_tracks(lat,lon,*args):
-        '''assumes eastward motion'''
-        tracks = []
-        lt,ln = [lat[0]],[lon[0]]
-        zz = [[z[0]] for z in args]
-        for i in range(1,len(lon)):
-            lt.append(lat[i])
-            for z,a in zip(zz,args):
-                z.append(a[i])
-            d1 = abs(lon[i] - lon[i-1])
-            d2 = abs((lon[i-1] + 360) - lon[i])
-            d3 = abs(lon[i-1] - (lon[i] + 360))
-            if d2 < d1:
-                ln.append(lon[i]-360)
-                tracks.append([np.array(lt),np.array(ln)] \
-                    + [np.array(z) for z in zz])
-                lt = [lat[i-1],lat[i]]
-                ln = [lon[i-1]+360,lon[i]]
-                zz = [[z[i-1]] for z in args]
-            elif d3 < d1:
-                ln.append(lon[i]+360)
-                tracks.append([np.array(lt),np.array(ln)] \
-                    + [np.array(z) for z in zz])
-                lt = [lat[i-1],lat[i]]
-                ln = [lon[i-1]-360,lon[i]]
-                zz = [[z[i-1],z[i]] for z in args]
-            else:
-                ln.append(lon[i])
-        if len(lt):
-            tracks.append([np.array(lt),np.array(ln)] \
-                + [np.array(z) for z in zz])
-        return tracks
+        '''split a ground track wherever the longitude wraps around
+
+        Each track is extended by one point across the wrap (shifted by
+        360 degrees) so that consecutive tracks meet at the map edge.
+        The tracks are returned laid end to end in flat arrays, with
+        np.split(lat,breaks) giving the individual tracks.
+        '''
+        lat = np.asarray(lat)
+        lon = np.asarray(lon)
+        args = [np.asarray(a) for a in args]
+
+        # +1 where the track wraps westward, -1 where it wraps eastward
+        Δlon = np.diff(lon)
+        wrap = (Δlon > 180).astype(int) - (Δlon < -180)
+        cuts = np.flatnonzero(wrap) + 1
+        shifts = 360 * wrap[cuts - 1]
+
+        # sample index range of each track, overlapping by two samples
+        # at every wrap
+        starts = np.r_[0, cuts - 1]
+        stops = np.r_[cuts + 1, len(lon)]
+        lengths = stops - starts
+        breaks = np.cumsum(lengths)[:-1]
+        idx = np.arange(lengths.sum()) \
+            + np.repeat(starts - np.r_[0, breaks], lengths)
+
+        lon = lon[idx].astype(float)
+        lon[breaks] += shifts
+        lon[breaks - 1] -= shifts
+        return SplitTracks(lat[idx], lon, [a[idx] for a in args], breaks)
 
     def plot_basemap(self,ax):
-        im = ax.imshow(self.image,
-            extent=[-180,180,-90,90],
-            aspect='equal',
-            origin='lower')
+        '''
+            add the map to ax, decoding only the tiles within the view
+            as it changes. returns the image
+        '''
+        im = _BasemapImage(ax,self,origin='lower')
+        ax.add_image(im)
+        im.set_extent([-180,180,-90,90])
+        ax.set_aspect('equal')
         ax.grid(True)
         MapView.set_ticks(ax)
         ax.autoscale(False)
+        im.refresh()
         return im
 
+    @property
+    def _grid(self):
+        '''tile columns and rows of the map and their size in degrees'''
+        ncols = 2**(self.zoomlevel+1)
+        nrows = 2**self.zoomlevel
+        return ncols,nrows,360/ncols,180/nrows
+
+    def _tile_window(self,xlim,ylim):
+        '''range of tile columns and rows covering the lon/lat limits'''
+        ncols,nrows,Δlon,Δlat = self._grid
+        x0,x1 = sorted(xlim)
+        y0,y1 = sorted(ylim)
+        c0 = min(max(int(np.floor((x0+180)/Δlon)),0),ncols-1)
+        c1 = min(max(int(np.ceil((x1+180)/Δlon)),c0+1),ncols)
+        r0 = min(max(int(np.floor((y0+90)/Δlat)),0),nrows-1)
+        r1 = min(max(int(np.ceil((y1+90)/Δlat)),r0+1),nrows)
+        return c0,c1,r0,r1
+
+    def _tile_image(self,c0,c1,r0,r1,previous=None,mosaic=None):
+        '''
+            image stitched from tile columns c0:c1 and rows r0:r1
+            along with its extent in degrees of longitude and latitude.
+            it is sliced from mosaic, the full map image, if given.
+            otherwise previous is the (window,image) of an earlier call,
+            the tiles it has in common with this window are copied
+            rather than decoded again
+        '''
+        ncols,nrows,Δlon,Δlat = self._grid
+        extent = [-180+c0*Δlon,-180+c1*Δlon,-90+r0*Δlat,-90+r1*Δlat]
+
+        if mosaic is not None:
+            th = mosaic.shape[0] // nrows
+            tw = mosaic.shape[1] // ncols
+            return mosaic[r0*th:r1*th,c0*tw:c1*tw],extent
+
+        prev_window,prev_image = previous or ((0,0,0,0),None)
+        pc0,pc1,pr0,pr1 = prev_window
+
+        tiles,reused = [],[]
+        for col in range(c0,c1):
+            for row in range(r0,r1):
+                if pc0 <= col < pc1 and pr0 <= row < pr1:
+                    reused.append((col,row))
+                else:
+                    tiles.append((col,row))
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            data = list(executor.map(lambda t: self.get_tile(*t),tiles))
+
+        if data:
+            th,tw = data[0].shape[:2]
+            shape = data[0].shape[2:]
+        else:
+            th = prev_image.shape[0] // (pr1-pr0)
+            tw = prev_image.shape[1] // (pc1-pc0)
+            shape = prev_image.shape[2:]
+        image = np.empty(((r1-r0)*th,(c1-c0)*tw) + shape,dtype=np.uint8)
+        for (col,row),tile in zip(tiles,data):
+            i,j = row-r0,col-c0
+            image[i*th:(i+1)*th,j*tw:(j+1)*tw] = tile
+        for col,row in reused:
+            i,j = row-r0,col-c0
+            pi,pj = row-pr0,col-pc0
+            image[i*th:(i+1)*th,j*tw:(j+1)*tw] = \
+                prev_image[pi*th:(pi+1)*th,pj*tw:(pj+1)*tw]
+        return image,extent
+
     @staticmethod
     def plot_marker(ax,lat,lon,**kwargs):
         kw = dict(
@@ -107,17 +351,36 @@ class MapView(object):
 
     @staticmethod
     def plot_track(ax,lat,lon,z=None,**kwargs):
+        '''
+            plot a ground track, split where the longitude wraps around,
+            returning a list holding the single artist drawn
+
+            Without z the tracks are drawn as one LineCollection, or as
+            one Line2D if kwargs holds Line2D-only options (e.g. marker).
+            With z the track is colored by z through colorline.
+        '''
+        tracks = MapView.split_tracks(lat,lon,*([] if z is None else [z]))
+
+        # NaN separators break a single line where the longitude wraps
+        def _join(a):
+            return np.insert(a.astype(float),tracks.breaks,np.nan)
+
         if z is None:
             kw = dict(
                 color = 'cyan',
                 alpha = 0.5,
                 lw = 3)
             kw.update(**kwargs)
-            tracks = MapView.split_tracks(lat,lon)
-            pts = []
-            for lt,ln in tracks:
-                pts.append(ax.plot(ln,lt,**kw))
-            return pts
+            if not _LINE2D_ONLY.isdisjoint(kw):
+                return ax.plot(_join(tracks.lon),_join(tracks.lat),**kw)
+            lts = np.split(tracks.lat,tracks.breaks)
+            lns = np.split(tracks.lon,tracks.breaks)
+            lc = mcoll.LineCollection(
+                [np.column_stack([ln,lt]) for ln,lt in zip(lns,lts)],**kw)
+            ax.add_collection(lc)
+            if ax.get_autoscale_on():
+                ax.autoscale_view()
+            return [lc]
         else:
             kw = dict(
                 alpha = 0.7,
@@ -125,45 +388,28 @@ class MapView(object):
                 cmap = cm.jet,
                 norm = colors.Normalize(vmin=z.min(), vmax=z.max()))
             kw.update(**kwargs)
-            tracks = MapView.split_tracks(lat,lon,z)
-            pts = []
-            for lt,ln,z in tracks:
-                pts.append(colorline(ax,ln,lt,z,**kw))
+            lt,ln,z = _join(tracks.lat),_join(tracks.lon),_join(tracks.zs[0])
+            return [colorline(ax,ln,lt,z,**kw)]
 
-            return pts
+    def get_tile(self,col,row):
+        '''single decoded map tile, row 0 being southernmost'''
+        fname = os.path.join(_MAP_ROOT,self.body.name.lower(),self.maptype,
+            str(self.zoomlevel),'{col}_{row}.png'.format(col=col,row=row))
+        return _read_tile(fname)[::-1]
+
+    def _cached_image(self,check_disk=True):
+        '''
+            the full map image if it is held in memory or, with
+            check_disk, cached on disk. None otherwise, the tiles are
+            never decoded
+        '''
+        return _get_mosaic(self.body.name.lower(),self.maptype,
+                           self.zoomlevel,build=False,check_disk=check_disk)
 
     @property
     def image(self):
-        bodyname = self.body.name.lower()
-        maptype = self.maptype
-        zoomlevel = self.zoomlevel
-
-        key = (bodyname,maptype,zoomlevel)
-        if hasattr(self,'_images'):
-            if key in self._images:
-                return self._images[key]
-        else:
-            self._images = {}
-
-        curdir = os.path.dirname(os.path.realpath(__file__))
-        fpath = os.path.join(curdir,
-            '..','map_images',bodyname,maptype,str(zoomlevel))
-        ffmt = '{col}_{row}.png'
-
-        images = []
-
-        for col in range(2**(zoomlevel+1)):
-            imrow = []
-            for row in range(2**zoomlevel):
-                fname = os.path.join(fpath,ffmt.format(col=col,row=row))
-                data = pyplot.imread(fname)
-                data_u8 = (data[::-1,...,...] * np.iinfo(np.uint8).max)\
-                            .astype(np.uint8,casting='unsafe')
-                imrow.append(data_u8)
-                del data
-            images.append(np.vstack(imrow))
-        self._images[key] = np.hstack(images)
-        return self._images[key]
+        return _get_mosaic(self.body.name.lower(),self.maptype,
+                           self.zoomlevel)
 
 if __name__ == '__main__':
     class CelestialBody(object):
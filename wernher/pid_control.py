@@ -1,10 +1,23 @@
 import numpy as np
 
 inf = np.inf
-isclose = np.isclose
+
+# (kp, ki, kd) from the ultimate gain ku and oscillation period tu
+_ziegler_nichols = dict(
+    p = lambda ku,tu: (.5*ku, 0, 0),
+    pi = lambda ku,tu: (.45*ku, .54*ku/tu, 0),
+    pd = lambda ku,tu: (.8*ku, 0, .1*ku*tu),
+    pid = lambda ku,tu: (.6*ku, 1.2*ku/tu, .075*ku*tu),
+    pessen = lambda ku,tu: (.7*ku, 1.75*ku/tu, .105*ku*tu),
+    some_overshoot = lambda ku,tu: (.33*ku, .66*ku/tu, .11*ku*tu),
+    no_overshoot = lambda ku,tu: (.2*ku, .4*ku/tu, ku*tu/15),
+)
 
 class Controller(object):
     '''Single Axis PID Controller'''
+    __slots__ = ('kp','ki','kd','set_point','deadband','cmin','cmax',
+                 't0','kiI','P0','c')
+
     def __init__(self, kp=1, ki=0, kd=0,
                  set_point=0, deadband=0.001, cmin=-1, cmax=1,
                  t0=0):
@@ -27,57 +40,78 @@ class Controller(object):
         self.c = 0
 
     def __call__(self,x,t):
+        r,self.t0,self.kiI,self.P0,self.c = \
+            self._step(x,t,self.t0,self.kiI,self.P0,self.c)
+        return r
+
+    def _step(self,x,t,t0,kiI,P0,c):
+        '''
+            one update from the state (t0,kiI,P0,c) of the previous call,
+            returning the response and the new state
+        '''
+        kp,ki,kd = self.kp,self.ki,self.kd
+        cmin,cmax = self.cmin,self.cmax
+
         # if parameters are all zero or None, return zero
-        if not any([self.kp,self.ki,self.kd]):
-            self.t0 = t
-            return 0
+        if not (kp or ki or kd):
+            return 0,t,kiI,P0,c
 
-        Δt = t - self.t0
+        Δt = t - t0
 
         # return previous value if no time has passed
-        if isclose(Δt, 0):
-            return self.c
+        if abs(Δt) < 1e-12:
+            return c,t0,kiI,P0,c
 
         P = self.set_point - x
 
         if abs(P) < self.deadband:
             kpP = 0
         else:
-            kpP = self.kp * P
+            kpP = kp * P
 
-        if Δt > self.td:
+        # derivative and integral times (see td and ti properties)
+        td = kd / kp if kp else inf
+        ti = kp / ki if ki else inf
+
+        if Δt > td:
             kdD = 0
         else:
-            ΔP = P - self.P0
-            D = ΔP / Δt
-            kdD = self.kd*D
+            D = (P - P0) / Δt
+            kdD = kd*D
 
-        if Δt > self.ti:
-            kiI = 0
+        if Δt <= ti and ki > 0 and cmin < kpP < cmax:
+            kiI = min(max(kiI + ki * P * Δt,cmin),cmax)
         else:
-            if self.ki > 0:
-                if not (self.cmin < kpP < self.cmax):
-                    kiI = 0
-                else:
-                    kiI = self.kiI + self.ki * P * Δt
-                    kiI = min(max(kiI,self.cmin),self.cmax)
-
-        self.c = kpP + kiI + kdD
+            kiI = 0
 
         # clip output to specified limits
-        self.c = min(max(self.c,self.cmin),self.cmax)
+        c = min(max(kpP + kiI + kdD,cmin),cmax)
 
-        # save parameters to class instance
-        self.t0 = t
-        self.kiI = kiI
-        self.P0 = P
+        return c,t,kiI,P,c
 
-        return self.c
+    def step_batch(self,xs,ts):
+        '''
+            feed a series of measurements xs taken at times ts through
+            the controller, returning the array of responses
+        '''
+        xs,ts = (np.asarray(a if hasattr(a,'__array__') else list(a),
+                            dtype=float) for a in (xs,ts))
+        if xs.shape != ts.shape:
+            raise ValueError(
+                'xs and ts must have the same shape, got {} and {}'\
+                .format(xs.shape,ts.shape))
+        out = np.empty(xs.shape)
+        step = self._step
+        state = self.t0,self.kiI,self.P0,self.c
+        for i,(x,t) in enumerate(zip(xs.flat,ts.flat)):
+            out.flat[i],*state = step(x,t,*state)
+        self.t0,self.kiI,self.P0,self.c = state
+        return out
 
     @property
     def ti(self):
         '''integral time'''
-        return self.kp / self.ki
+        return self.kp / self.ki if self.ki else inf
     @ti.setter
     def ti(self,ti):
         self.ki = self.kp / ti
@@ -85,7 +119,7 @@ class Controller(object):
     @property
     def td(self):
         '''derivative time'''
-        return self.kd / self.kp
+        return self.kd / self.kp if self.kp else inf
     @td.setter
     def td(self,td):
         self.kd = self.kp * td
@@ -112,13 +146,5 @@ class Controller(object):
             ku = ultimate gain
             tu = period of oscillation at ultimate gain
         '''
-        converter = dict(
-            p = lambda ku,tu: (.5*ku, 0, 0),
-            pi = lambda ku,tu: (.45*ku, 1.2*(.45*ku)/tu, 0),
-            pd = lambda ku,tu: (.8*ku, 0, (.8*ku)*tu/8),
-            pid = lambda ku,tu: (.6*ku, 2*(.6*ku)/tu, (.6*ku)*tu/8),
-            pessen = lambda ku,tu: (.7*ku, 2.5*(.7*ku)/tu, 3*(.7*ku)*tu/20),
-            some_overshoot = lambda ku,tu: (.33*ku, 2*(.33*ku)/tu, (.33*ku)*tu/3),
-            no_overshoot = lambda ku,tu: (.2*ku, 2*(.2*ku)/tu, (.2*ku)*tu/3)
-        )
-        self.kp,self.ki,self.kd = converter[control_type.lower()](ku,tu)
+        self.kp,self.ki,self.kd = \
+            _ziegler_nichols[control_type.lower()](ku,tu)